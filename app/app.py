@@ -1,21 +1,27 @@
 import json
+import orjson
 import boto3
+from botocore.config import Config
 import os
 import logging
 import traceback
-from datetime import datetime
 import uuid
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify, Response, g
 from opentelemetry import trace, metrics
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
 from opentelemetry.sdk.metrics import MeterProvider
 from opentelemetry.sdk.resources import Resource
 from prometheus_client import Counter, Histogram, generate_latest, CollectorRegistry, push_to_gateway
 import threading
+from collections import OrderedDict
+import queue
 
 app = Flask(__name__)
 
@@ -30,13 +36,23 @@ PORT = int(os.environ.get('PORT', 8080))
 METRICS_PORT = int(os.environ.get('METRICS_PORT', 9090))
 PROMETHEUS_REMOTE_WRITE_URL = os.environ.get('PROMETHEUS_REMOTE_WRITE_URL', '')
 AWS_REGION = os.environ.get('AWS_REGION', 'us-west-2')
+TRACE_SAMPLE_RATIO = float(os.environ.get('TRACE_SAMPLE_RATIO', 0.1))
+METRICS_PUSH_INTERVAL = 15
+METRICS_CACHE_TTL = 1.0
+LOKI_BATCH_SIZE = 500
+LOKI_BATCH_WAIT = 1.0
+LOKI_MIN_LEVEL = getattr(logging, os.environ.get('LOKI_MIN_LEVEL', 'INFO').upper())
+TRACEBACK_LIMIT = 10
+# Bad-input errors on the write path whose stack traces carry no diagnostic value
+CLIENT_ERRORS = (ValueError, KeyError)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configure OpenTelemetry with Tempo exporter
 trace_provider = TracerProvider(
-    resource=Resource.create({"service.name": "DocStorageService"})
+    resource=Resource.create({"service.name": "DocStorageService"}),
+    sampler=ParentBasedTraceIdRatio(TRACE_SAMPLE_RATIO)
 )
 if TEMPO_ENDPOINT:
     try:
@@ -65,10 +81,89 @@ meter = metrics.get_meter("DocStorageService")
 # Business-oriented Prometheus metrics
 registry = CollectorRegistry()
 DOC_OPERATIONS_TOTAL = Counter('doc_operations_total', 'Total document operations', ['service', 'operation', 'status_type'], registry=registry)
-DOC_OPERATION_DURATION = Histogram('doc_operation_duration_seconds', 'Document operation duration', ['service', 'operation'], registry=registry)
+# Buckets sized for S3 round-trips; fewer buckets keep observe() and /metrics cheap
+DOC_OPERATION_DURATION = Histogram('doc_operation_duration_seconds', 'Document operation duration', ['service', 'operation'], buckets=(0.005, 0.025, 0.1, 0.5, 2.5), registry=registry)
 
-s3 = boto3.client('s3')
+# Bind labelled children once so request handlers skip the label lookup
+WRITE_DUR = DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='WriteDoc')
+READ_DUR = DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='ReadDoc')
+WRITE_OK = DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='WriteDoc', status_type='success')
+WRITE_SERVICE_ERROR = DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='WriteDoc', status_type='service_error')
+READ_OK = DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='success')
+READ_CLIENT_ERROR = DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='client_error')
+READ_SERVICE_ERROR = DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='service_error')
+
+# ReadDoc durations include cache hits; the hit ratio tells them apart from S3 reads
+DOC_CACHE_LOOKUPS_TOTAL = Counter('doc_cache_lookups_total', 'Document cache lookups', ['service', 'result'], registry=registry)
+CACHE_HIT = DOC_CACHE_LOOKUPS_TOTAL.labels(service='DocStorageService', result='hit')
+CACHE_MISS = DOC_CACHE_LOOKUPS_TOTAL.labels(service='DocStorageService', result='miss')
+
+s3 = boto3.client('s3', config=Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=5
+))
 BUCKET_NAME = os.environ['BUCKET_NAME']
+DOC_CACHE_MAX_BYTES = int(os.environ.get('DOC_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+DOC_CACHE_MAX_DOC_BYTES = 1024 * 1024
+DOC_CACHE_TTL = float(os.environ.get('DOC_CACHE_TTL', 30))
+
+def parse_json(raw):
+    """Parse JSON bytes with orjson, falling back to the stdlib for NaN/Infinity"""
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return json.loads(raw)
+
+def get_cached_document(key):
+    """Return the cached bytes for a document, or None if absent or expired.
+
+    Objects can be overwritten or deleted outside the app, so a cached copy
+    may be up to DOC_CACHE_TTL seconds out of date.
+    """
+    now = time.monotonic()
+    with _doc_cache_lock:
+        entry = _doc_cache.get(key)
+        if entry is None or now - entry[0] >= DOC_CACHE_TTL:
+            return None
+        _doc_cache.move_to_end(key)
+        return entry[1]
+
+def cache_document(key, raw):
+    """Cache document bytes, evicting least recently used entries over the byte budget"""
+    global _doc_cache_bytes
+    if len(raw) > DOC_CACHE_MAX_DOC_BYTES:
+        return
+
+    with _doc_cache_lock:
+        previous = _doc_cache.pop(key, None)
+        if previous is not None:
+            _doc_cache_bytes -= len(previous[1])
+        _doc_cache[key] = (time.monotonic(), raw)
+        _doc_cache_bytes += len(raw)
+        while _doc_cache_bytes > DOC_CACHE_MAX_BYTES:
+            _, (_, evicted) = _doc_cache.popitem(last=False)
+            _doc_cache_bytes -= len(evicted)
+
+def fetch_document(key):
+    """Fetch a document from S3, validate it and add it to the cache.
+
+    The stored bytes are only parsed to validate them and are returned
+    unchanged, so values orjson cannot round-trip (e.g. integers wider
+    than 64 bits) reach the client exactly as stored.
+    """
+    response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    raw = response['Body'].read()
+    parse_json(raw)
+    cache_document(key, raw)
+    return raw
+
+# Recently read documents as key -> (fetched_at, raw bytes), in LRU order
+_doc_cache = OrderedDict()
+_doc_cache_bytes = 0
+_doc_cache_lock = threading.Lock()
 
 def push_metrics_to_prometheus():
     """Push metrics to AWS Managed Prometheus using remote write"""
@@ -88,37 +183,57 @@ def push_metrics_to_prometheus():
     except Exception as e:
         logger.warning(f"Failed to push metrics to Prometheus: {e}")
 
-def push_logs_to_loki(level, message, operation=None, doc_key=None):
-    """Push logs to Loki with business context"""
+def metrics_worker():
+    """Push metrics on a fixed interval from a single background thread"""
+    while True:
+        time.sleep(METRICS_PUSH_INTERVAL)
+        push_metrics_to_prometheus()
+
+if PROMETHEUS_REMOTE_WRITE_URL:
+    threading.Thread(target=metrics_worker, daemon=True).start()
+
+def enqueue_log(level, message, operation=None):
+    """Queue a log line with business context for batched delivery to Loki"""
+    global loki_dropped
     if not LOKI_ENDPOINT:
-        logger.debug("Loki endpoint not configured")
         return
-        
+
+    # Keep labels low-cardinality; request IDs and document keys belong in the message
+    labels = {
+        'service': 'DocStorageService',
+        'level': level
+    }
+    if operation:
+        labels['operation'] = operation
+
     try:
-        labels = {
-            'service': 'DocStorageService',
-            'level': level,
-            'request_id': getattr(g, 'request_id', 'unknown')
-        }
-        if operation:
-            labels['operation'] = operation
-        if doc_key:
-            labels['doc_key'] = doc_key
-        
-        payload = {
-            'streams': [{
-                'stream': labels,
-                'values': [[str(int(time.time() * 1000000000)), message]]
-            }]
-        }
-        
-        response = requests.post(
+        loki_queue.put_nowait((str(time.time_ns()), tuple(sorted(labels.items())), message))
+    except queue.Full:
+        # Bound memory when Loki is slow or unreachable
+        with loki_dropped_lock:
+            loki_dropped += 1
+
+def push_logs_to_loki(batch):
+    """Push a batch of queued log lines to Loki, one stream per label set"""
+    streams = {}
+    for ts_ns, labels_key, message in batch:
+        streams.setdefault(labels_key, []).append([ts_ns, message])
+
+    payload = {
+        'streams': [
+            {'stream': dict(labels_key), 'values': values}
+            for labels_key, values in streams.items()
+        ]
+    }
+
+    try:
+        response = LOKI_SESSION.post(
             f"{LOKI_ENDPOINT}/loki/api/v1/push", 
             json=payload, 
             timeout=3
         )
         if response.status_code == 204:
-            logger.debug("Successfully pushed to Loki")
+            logger.debug(f"Successfully pushed {len(batch)} log lines to Loki")
         else:
             logger.warning(f"Loki returned status {response.status_code}")
             
@@ -129,17 +244,91 @@ def push_logs_to_loki(level, message, operation=None, doc_key=None):
     except Exception as e:
         logger.warning(f"Failed to push to Loki: {e}")
 
+def loki_worker():
+    """Drain the log queue and flush to Loki on batch size or wait thresholds"""
+    global loki_dropped
+    while True:
+        batch = [loki_queue.get()]
+        deadline = time.monotonic() + LOKI_BATCH_WAIT
+        while len(batch) < LOKI_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(loki_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        push_logs_to_loki(batch)
+
+        with loki_dropped_lock:
+            dropped, loki_dropped = loki_dropped, 0
+        if dropped:
+            logger.warning(f"Loki queue full, {dropped} log lines dropped since last flush")
+
+loki_queue = queue.Queue(maxsize=10000)
+loki_dropped = 0
+loki_dropped_lock = threading.Lock()
+# Reuse keep-alive connections to Loki across pushes
+LOKI_SESSION = requests.Session()
+LOKI_SESSION.mount('http://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=1, backoff_factor=0.1)
+))
+if LOKI_ENDPOINT:
+    threading.Thread(target=loki_worker, daemon=True).start()
+else:
+    logger.debug("Loki endpoint not configured")
+
+def log_event(level, fmt, *args, operation=None):
+    """Log to stdout and Loki, formatting the message only if a sink wants it"""
+    levelno = getattr(logging, level.upper())
+    to_logger = logger.isEnabledFor(levelno)
+    to_loki = bool(LOKI_ENDPOINT) and levelno >= LOKI_MIN_LEVEL
+    if not (to_logger or to_loki):
+        return
+
+    message = fmt % args
+    if to_logger:
+        logger.log(levelno, message)
+    if to_loki:
+        enqueue_log(level, message, operation=operation)
+
+def log_service_error(error_msg, operation, with_trace=True):
+    """Log a failed operation, optionally attaching a capped stack trace"""
+    if not with_trace:
+        log_event('error', "%s", error_msg, operation=operation)
+        return
+
+    stack_trace = traceback.format_exc(limit=TRACEBACK_LIMIT)
+    log_event('error', "%s\nStack trace:\n%s", error_msg, stack_trace, operation=operation)
+
+# Rendered /metrics body, shared by scrapes within METRICS_CACHE_TTL
+_metrics_lock = threading.Lock()
+_cached_ts = 0.0
+_cached_bytes = None
+
+HEALTH_BYTES_TEMPLATE = b'{"status":"healthy","timestamp":%d}'
+
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return Response(HEALTH_BYTES_TEMPLATE % time.time_ns(), mimetype='application/json')
 
 @app.route('/metrics')
 def metrics_endpoint():
-    return Response(generate_latest(registry), mimetype='text/plain')
+    global _cached_ts, _cached_bytes
+    with _metrics_lock:
+        now = time.monotonic()
+        if _cached_bytes is None or now - _cached_ts >= METRICS_CACHE_TTL:
+            _cached_bytes = generate_latest(registry)
+            _cached_ts = now
+        body = _cached_bytes
+    return Response(body, mimetype='text/plain')
 
 @app.route('/data', methods=['POST'])
 def post_data():
-    start_time = time.time()
+    start_time = time.monotonic()
     
     with tracer.start_as_current_span("WriteDoc") as span:
         try:
@@ -147,66 +336,58 @@ def post_data():
             span.set_attribute("operation", "WriteDoc")
             span.set_attribute("request_id", g.request_id)
             
-            log_msg = f"[{g.request_id}] Starting WriteDoc operation"
-            logger.info(log_msg)
-            push_logs_to_loki('info', log_msg, operation='WriteDoc')
+            log_event('info', "[%s] Starting WriteDoc operation", g.request_id, operation='WriteDoc')
             
-            body = request.get_json()
-            if body is None:
+            if not request.is_json:
+                raise ValueError("Request Content-Type must be application/json")
+
+            # Parse only to validate; the original bytes are stored as-is
+            serialized = request.get_data(cache=False)
+            if parse_json(serialized) is None:
                 raise ValueError("Request must contain valid JSON data")
 
-            with tracer.start_as_current_span("s3_store_document") as s3_span:
-                key = f"documents/{datetime.now().isoformat()}-{uuid.uuid4()}.json"
-                
-                s3_span.set_attribute("doc.key", key)
-                s3_span.set_attribute("storage.type", "s3")
-                s3_span.set_attribute("doc.size_bytes", len(json.dumps(body)))
-                
-                log_msg = f"[{g.request_id}] WriteDoc - Starting S3 put_object for key: {key}"
-                logger.info(log_msg)
-                push_logs_to_loki('info', log_msg, operation='WriteDoc', doc_key=key)
-                
-                s3.put_object(
-                    Bucket=BUCKET_NAME,
-                    Key=key,
-                    Body=json.dumps(body),
-                    ContentType='application/json'
-                )
-                
-                log_msg = f"[{g.request_id}] WriteDoc - S3 put_object completed successfully for key: {key}"
-                logger.info(log_msg)
-                push_logs_to_loki('info', log_msg, operation='WriteDoc', doc_key=key)
-                
-                duration = time.time() - start_time
-                DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='WriteDoc').observe(duration)
-                DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='WriteDoc', status_type='success').inc()
-                
-                log_msg = f"[{g.request_id}] WriteDoc operation completed successfully in {duration:.3f}s - document stored with key: {key}"
-                logger.info(log_msg)
-                push_logs_to_loki('info', log_msg, operation='WriteDoc', doc_key=key)
-                
-                threading.Thread(target=push_metrics_to_prometheus, daemon=True).start()
-                
-                return jsonify({'message': 'Document stored successfully', 'key': key})
-                
+            key = f"documents/{time.time_ns()}-{uuid.uuid4().hex}.json"
+            
+            span.set_attribute("doc.key", key)
+            span.set_attribute("storage.type", "s3")
+            span.set_attribute("s3.op", "put")
+            span.set_attribute("doc.size_bytes", len(serialized))
+            
+            log_event('info', "[%s] WriteDoc - Starting S3 put_object for key: %s", g.request_id, key, operation='WriteDoc')
+            
+            s3.put_object(
+                Bucket=BUCKET_NAME,
+                Key=key,
+                Body=serialized,
+                ContentType='application/json'
+            )
+            
+            log_event('info', "[%s] WriteDoc - S3 put_object completed successfully for key: %s", g.request_id, key, operation='WriteDoc')
+            
+            duration = time.monotonic() - start_time
+            WRITE_DUR.observe(duration)
+            WRITE_OK.inc()
+            
+            log_event('info', "[%s] WriteDoc operation completed successfully in %.3fs - document stored with key: %s", g.request_id, duration, key, operation='WriteDoc')
+            
+            return jsonify({'message': 'Document stored successfully', 'key': key})
+            
         except Exception as e:
-            duration = time.time() - start_time
-            DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='WriteDoc').observe(duration)
-            DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='WriteDoc', status_type='service_error').inc()
+            duration = time.monotonic() - start_time
+            WRITE_DUR.observe(duration)
+            WRITE_SERVICE_ERROR.inc()
             
             span.set_attribute("error", True)
             span.set_attribute("error.message", str(e))
             
             error_msg = f"[{g.request_id}] WriteDoc operation failed after {duration:.3f}s due to service error: {str(e)}"
-            stack_trace = traceback.format_exc()
-            logger.error(f"{error_msg}\nStack trace:\n{stack_trace}")
-            push_logs_to_loki('error', f"{error_msg}\nStack trace: {stack_trace}", operation='WriteDoc')
+            log_service_error(error_msg, operation='WriteDoc', with_trace=not isinstance(e, CLIENT_ERRORS))
             
             return jsonify({'error': 'Service error occurred'}), 500
 
 @app.route('/data/<path:key>')
 def get_data(key):
-    start_time = time.time()
+    start_time = time.monotonic()
     
     with tracer.start_as_current_span("ReadDoc") as span:
         try:
@@ -215,59 +396,51 @@ def get_data(key):
             span.set_attribute("doc.key", key)
             span.set_attribute("request_id", g.request_id)
             
-            log_msg = f"[{g.request_id}] Starting ReadDoc operation for key: {key}"
-            logger.info(log_msg)
-            push_logs_to_loki('info', log_msg, operation='ReadDoc', doc_key=key)
+            log_event('info', "[%s] Starting ReadDoc operation for key: %s", g.request_id, key, operation='ReadDoc')
             
-            with tracer.start_as_current_span("s3_retrieve_document") as s3_span:
-                s3_span.set_attribute("doc.key", key)
-                s3_span.set_attribute("storage.type", "s3")
-                
-                log_msg = f"[{g.request_id}] ReadDoc - Starting S3 get_object for key: {key}"
-                logger.info(log_msg)
-                push_logs_to_loki('info', log_msg, operation='ReadDoc', doc_key=key)
-                
-                try:
-                    response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-                    data = json.loads(response['Body'].read())
-                    
-                    log_msg = f"[{g.request_id}] ReadDoc - S3 get_object completed successfully for key: {key}"
-                    logger.info(log_msg)
-                    push_logs_to_loki('info', log_msg, operation='ReadDoc', doc_key=key)
-                    
-                    duration = time.time() - start_time
-                    DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='ReadDoc').observe(duration)
-                    DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='success').inc()
-                    
-                    log_msg = f"[{g.request_id}] ReadDoc operation completed successfully in {duration:.3f}s for key: {key}"
-                    logger.info(log_msg)
-                    push_logs_to_loki('info', log_msg, operation='ReadDoc', doc_key=key)
-                    
-                    return jsonify(data)
+            try:
+                raw = get_cached_document(key)
+                span.set_attribute("cache.hit", raw is not None)
+                if raw is not None:
+                    CACHE_HIT.inc()
+                else:
+                    CACHE_MISS.inc()
+                    span.set_attribute("storage.type", "s3")
+                    span.set_attribute("s3.op", "get")
                     
-                except s3.exceptions.NoSuchKey:
-                    duration = time.time() - start_time
-                    DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='ReadDoc').observe(duration)
-                    DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='client_error').inc()
+                    log_event('info', "[%s] ReadDoc - Starting S3 get_object for key: %s", g.request_id, key, operation='ReadDoc')
                     
-                    log_msg = f"[{g.request_id}] ReadDoc failed after {duration:.3f}s - document not found for key: {key}"
-                    logger.warning(log_msg)
-                    push_logs_to_loki('warning', log_msg, operation='ReadDoc', doc_key=key)
-                    
-                    return jsonify({'error': 'Document not found'}), 404
+                    raw = fetch_document(key)
                     
+                    log_event('info', "[%s] ReadDoc - S3 get_object completed successfully for key: %s", g.request_id, key, operation='ReadDoc')
+                
+                duration = time.monotonic() - start_time
+                READ_DUR.observe(duration)
+                READ_OK.inc()
+                
+                log_event('info', "[%s] ReadDoc operation completed successfully in %.3fs for key: %s", g.request_id, duration, key, operation='ReadDoc')
+                
+                return Response(raw, mimetype='application/json')
+                
+            except s3.exceptions.NoSuchKey:
+                duration = time.monotonic() - start_time
+                READ_DUR.observe(duration)
+                READ_CLIENT_ERROR.inc()
+                
+                log_event('warning', "[%s] ReadDoc failed after %.3fs - document not found for key: %s", g.request_id, duration, key, operation='ReadDoc')
+                
+                return jsonify({'error': 'Document not found'}), 404
+                
         except Exception as e:
-            duration = time.time() - start_time
-            DOC_OPERATION_DURATION.labels(service='DocStorageService', operation='ReadDoc').observe(duration)
-            DOC_OPERATIONS_TOTAL.labels(service='DocStorageService', operation='ReadDoc', status_type='service_error').inc()
+            duration = time.monotonic() - start_time
+            READ_DUR.observe(duration)
+            READ_SERVICE_ERROR.inc()
             
             span.set_attribute("error", True)
             span.set_attribute("error.message", str(e))
             
-            error_msg = f"[{g.request_id}] ReadDoc operation failed after {duration:.3f}s due to service error: {str(e)}"
-            stack_trace = traceback.format_exc()
-            logger.error(f"{error_msg}\nStack trace:\n{stack_trace}")
-            push_logs_to_loki('error', f"{error_msg}\nStack trace: {stack_trace}", operation='ReadDoc', doc_key=key)
+            error_msg = f"[{g.request_id}] ReadDoc operation failed after {duration:.3f}s for key: {key} due to service error: {str(e)}"
+            log_service_error(error_msg, operation='ReadDoc')
             
             return jsonify({'error': 'Service error occurred'}), 500
 